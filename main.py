@@ -13,13 +13,22 @@ Features:
 - Uses pyTelegramBotAPI (telebot)
 """
 
+import json
+import logging
 import os
+import secrets
 import sqlite3
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 import telebot
 from telebot import types
 
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logging.getLogger("TeleBot").setLevel(logging.WARNING)  # suppress library chatter
+log = logging.getLogger("confbot")
+
 # -------------------------
 # CONFIG: token & main admin
 # -------------------------
@@ -27,21 +36,103 @@ BOT_TOKEN = os.environ.get("BOT_TOKEN") or "YOURTOKENHERE"
 MAIN_ADMIN = int(os.environ.get("MAIN_ADMIN") or YOURIDHERE)  # change to your id
 # Note: Confessions will be posted to channels stored in DB. No single CHANNEL_ID here.
 
-bot = telebot.TeleBot(BOT_TOKEN, parse_mode="HTML")
+# Webhook mode: set WEBHOOK_URL (public https base, e.g. https://bot.example.com)
+# to have Telegram push updates instead of long-polling getUpdates.
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+# Secret used in the webhook path and echoed back by Telegram in the
+# secret-token header — anyone who knows it can POST forged updates, so it
+# must be unguessable. Generated fresh each boot unless pinned via env
+# (pin it when running several workers behind one endpoint).
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_PORT = int(os.environ.get("PORT") or 8443)
+
+# Optional log chat: approval notices are sent there once, then copied to
+# each admin server-side instead of re-uploading the payload per admin.
+LOG_CHAT_ID = int(os.environ.get("LOG_CHAT_ID") or 0)
+
+# num_threads lets telebot overlap handler I/O instead of serializing
+# updates on the polling thread
+bot = telebot.TeleBot(BOT_TOKEN, parse_mode="HTML", num_threads=16)
+
+# -------------------------
+# Outbound send pool + rate limit
+# -------------------------
+class RateLimiter:
+    """Token bucket keeping outbound Telegram calls under the global ~30 msg/sec cap."""
+    def __init__(self, rate, per):
+        self.capacity = float(rate)
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.fill_rate)
+                self.timestamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+EXECUTOR = ThreadPoolExecutor(max_workers=20)
+LIMITER = RateLimiter(30, 1.0)
+
+_bot_me = None
+
+def get_bot_me():
+    # getMe never changes for a given token; fetch once and reuse
+    global _bot_me
+    if _bot_me is None:
+        _bot_me = bot.get_me()
+    return _bot_me
+
+def rate_limited_send(send_fn, *args, **kwargs):
+    """Call a bot send method under the rate limit, retrying once on 429."""
+    LIMITER.acquire()
+    try:
+        return send_fn(*args, **kwargs)
+    except telebot.apihelper.ApiTelegramException as e:
+        if e.error_code == 429:
+            retry_after = 1
+            if e.result_json:
+                retry_after = e.result_json.get("parameters", {}).get("retry_after", 1)
+            time.sleep(retry_after)
+            return send_fn(*args, **kwargs)
+        raise
 
 # -------------------------
 # DB: connect and init
 # -------------------------
 DB_PATH = "database.db"
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cursor = conn.cursor()
+_db_local = threading.local()
+
+def _conn():
+    # telebot runs handlers on multiple threads; sqlite3 connections are not
+    # safe to share, so each thread lazily opens its own tuned connection
+    c = getattr(_db_local, "conn", None)
+    if c is None:
+        c = sqlite3.connect(DB_PATH, check_same_thread=False)
+        c.row_factory = sqlite3.Row
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=NORMAL")
+        c.execute("PRAGMA temp_store=MEMORY")
+        c.execute("PRAGMA mmap_size=134217728")
+        c.execute("PRAGMA cache_size=-20000")
+        _db_local.conn = c
+    return c
 
 def init_db():
     # professional schema
+    conn = _conn()
+    cursor = conn.cursor()
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY,      -- telegram user id
-        first_seen TEXT
+        first_seen TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now'))
     )""")
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS confessions (
@@ -50,33 +141,52 @@ def init_db():
         content TEXT,
         tags TEXT,                  -- comma separated
         status TEXT,                -- pending / approved / declined
-        created_at TEXT
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now'))
     )""")
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS comments (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         confession_id INTEGER,
         text TEXT,
-        created_at TEXT
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now'))
     )""")
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS admins (
         id INTEGER PRIMARY KEY,     -- admin user id
         added_by INTEGER,
-        added_at TEXT
+        added_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now'))
     )""")
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS channels (
         id INTEGER PRIMARY KEY,     -- channel chat id (may be negative)
         username TEXT,
         added_by INTEGER,
-        added_at TEXT
+        added_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+        title TEXT,
+        type TEXT,
+        verified_at TEXT            -- last time bot admin rights were confirmed
     )""")
+    # upgrade older databases that predate the channel metadata columns
+    for col in ("title TEXT", "type TEXT", "verified_at TEXT"):
+        try:
+            cursor.execute(f"ALTER TABLE channels ADD COLUMN {col}")
+        except sqlite3.OperationalError:
+            pass
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS settings (
         key TEXT PRIMARY KEY,
         value TEXT
     )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS pending_state (
+        user_id INTEGER PRIMARY KEY,  -- one in-flight flow per user
+        kind TEXT,                    -- confess / add_comment
+        payload TEXT,                 -- JSON blob for the flow step
+        updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now'))
+    )""")
+    # indexes for the hot callback paths (comment paging, pending listing)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_comments_conf ON comments(confession_id, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_confessions_status ON confessions(status, id)")
     # Ensure MAIN_ADMIN is present in admins table as main (we'll keep main admin separate logic)
     conn.commit()
 
@@ -85,125 +195,243 @@ init_db()
 # -------------------------
 # Helpers: settings, admins, users
 # -------------------------
+# admin/channel/setting lookups run on every update, but the underlying
+# rows rarely change — cache them in-process and invalidate on write
+_cache_lock = threading.RLock()
+_admin_cache = None      # frozenset of secondary admin ids, None = reload
+_admin_cache_ts = 0.0    # monotonic time of last admin reload
+ADMIN_CACHE_TTL = 60     # seconds; bounds staleness across webhook workers
+_channels_cache = None   # immutable snapshot of channel rows, None = reload
+_settings_cache = {}     # key -> raw value (None = known missing)
+
 def get_setting(key, default=None):
-    cursor.execute("SELECT value FROM settings WHERE key=?", (key,))
-    row = cursor.fetchone()
-    return row[0] if row else default
+    with _cache_lock:
+        if key in _settings_cache:
+            val = _settings_cache[key]
+            return val if val is not None else default
+    cur = _conn().cursor()
+    cur.execute("SELECT value FROM settings WHERE key=?", (key,))
+    row = cur.fetchone()
+    val = row[0] if row else None
+    with _cache_lock:
+        _settings_cache[key] = val
+    return val if val is not None else default
 
 def set_setting(key, value):
-    cursor.execute("REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+    conn = _conn()
+    conn.execute("REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
     conn.commit()
+    with _cache_lock:
+        _settings_cache[key] = str(value)
 
 def is_auto_approve():
+    # served from _settings_cache after the boot-time warm below
     val = get_setting("auto_approve", "0")
     return val == "1"
 
 def set_auto_approve(on: bool):
     set_setting("auto_approve", "1" if on else "0")
 
+def ensure_setting_default(key, default):
+    # idempotent one-statement init: no read-then-write race when several
+    # webhook workers boot at the same time
+    conn = _conn()
+    conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", (key, str(default)))
+    conn.commit()
+
+# ensure the setting exists and pre-warm the cache at boot so the first
+# confession submission never pays the DB read; runs at import time so
+# webhook workers (which skip __main__) get it too
+ensure_setting_default("auto_approve", "0")
+get_setting("auto_approve")
+
 def add_user_if_missing(user_id):
-    cursor.execute("SELECT id FROM users WHERE id=?", (user_id,))
-    if cursor.fetchone() is None:
-        cursor.execute("INSERT INTO users (id, first_seen) VALUES (?, ?)", (user_id, datetime.utcnow().isoformat()))
-        conn.commit()
+    # timestamps are named explicitly as SQL expressions: databases created
+    # before the DEFAULT clauses existed would otherwise store NULL
+    conn = _conn()
+    conn.execute("INSERT OR IGNORE INTO users (id, first_seen) VALUES (?, strftime('%Y-%m-%dT%H:%M:%fZ','now'))",
+                 (user_id,))
+    conn.commit()
 
 def get_all_user_ids():
-    cursor.execute("SELECT id FROM users")
-    return [r[0] for r in cursor.fetchall()]
+    # stream ids straight off the cursor; broadcasts feed this to the send
+    # pool, so there is no need to materialize the whole user list first
+    cur = _conn().cursor()
+    cur.execute("SELECT id FROM users")
+    yield from (r[0] for r in cur)
 
 def add_secondary_admin(admin_id, added_by):
-    cursor.execute("SELECT id FROM admins WHERE id=?", (admin_id,))
-    if cursor.fetchone():
-        return False
-    cursor.execute("INSERT INTO admins (id, added_by, added_at) VALUES (?, ?, ?)", (admin_id, added_by, datetime.utcnow().isoformat()))
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute("INSERT OR IGNORE INTO admins (id, added_by, added_at) VALUES (?, ?, strftime('%Y-%m-%dT%H:%M:%fZ','now'))",
+                (admin_id, added_by))
     conn.commit()
+    if cur.rowcount == 0:
+        return False
+    with _cache_lock:
+        global _admin_cache
+        _admin_cache = None
     return True
 
 def remove_secondary_admin(admin_id):
-    cursor.execute("DELETE FROM admins WHERE id=?", (admin_id,))
+    conn = _conn()
+    conn.execute("DELETE FROM admins WHERE id=?", (admin_id,))
     conn.commit()
+    with _cache_lock:
+        global _admin_cache
+        _admin_cache = None
 
 def list_secondary_admins():
-    cursor.execute("SELECT id, added_by, added_at FROM admins")
-    return cursor.fetchall()
+    cur = _conn().cursor()
+    cur.execute("SELECT id, added_by, added_at FROM admins")
+    return cur.fetchall()
+
+def _admin_ids():
+    global _admin_cache, _admin_cache_ts
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _admin_cache
+        fresh = (now - _admin_cache_ts) < ADMIN_CACHE_TTL
+    if cached is None or not fresh:
+        cur = _conn().cursor()
+        cur.execute("SELECT id FROM admins")
+        cached = frozenset(r[0] for r in cur.fetchall())
+        with _cache_lock:
+            _admin_cache = cached
+            _admin_cache_ts = now
+    return cached
 
 def is_admin(user_id):
-    if user_id == MAIN_ADMIN:
-        return True
-    cursor.execute("SELECT 1 FROM admins WHERE id=?", (user_id,))
-    return cursor.fetchone() is not None
+    return user_id == MAIN_ADMIN or user_id in _admin_ids()
+
+def admin_only(fn):
+    # one shared auth gate for handlers instead of an inline check per body
+    @wraps(fn)
+    def wrapper(m, *args, **kwargs):
+        if not is_admin(m.from_user.id):
+            bot.send_message(m.chat.id, "Not authorized.")
+            return
+        return fn(m, *args, **kwargs)
+    return wrapper
 
 # -------------------------
 # Confession helpers
 # -------------------------
+# every callback action re-reads its confession row, often twice; keep a
+# bounded dict of loaded confessions, popped precisely on status change
+_conf_cache = {}
+
 def create_confession(user_id, content, tags_list, status="pending"):
     tags_str = ",".join(tags_list) if tags_list else ""
-    cursor.execute(
-        "INSERT INTO confessions (user_id, content, tags, status, created_at) VALUES (?, ?, ?, ?, ?)",
-        (user_id, content, tags_str, status, datetime.utcnow().isoformat())
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO confessions (user_id, content, tags, status, created_at) VALUES (?, ?, ?, ?, strftime('%Y-%m-%dT%H:%M:%fZ','now'))",
+        (user_id, content, tags_str, status)
     )
     conn.commit()
-    return cursor.lastrowid
+    return cur.lastrowid
 
 def get_confession_by_id(conf_id):
-    cursor.execute("SELECT id, user_id, content, tags, status, created_at FROM confessions WHERE id=?", (conf_id,))
-    row = cursor.fetchone()
+    with _cache_lock:
+        conf = _conf_cache.get(conf_id)
+    if conf is not None:
+        return conf
+    cur = _conn().cursor()
+    cur.execute("SELECT id, user_id, content, tags, status, created_at FROM confessions WHERE id=?", (conf_id,))
+    row = cur.fetchone()
     if not row:
         return None
-    return {
-        "id": row[0],
-        "user_id": row[1],
-        "content": row[2],
-        "tags": row[3].split(",") if row[3] else [],
-        "status": row[4],
-        "created_at": row[5]
-    }
+    conf = dict(row)
+    conf["tags"] = row["tags"].split(",") if row["tags"] else []
+    with _cache_lock:
+        if len(_conf_cache) >= 1024:
+            _conf_cache.clear()
+        _conf_cache[conf_id] = conf
+    return conf
 
 def set_confession_status(conf_id, status):
-    cursor.execute("UPDATE confessions SET status=? WHERE id=?", (status, conf_id))
+    conn = _conn()
+    conn.execute("UPDATE confessions SET status=? WHERE id=?", (status, conf_id))
     conn.commit()
+    with _cache_lock:
+        _conf_cache.pop(conf_id, None)
 
-def get_pending_confessions():
-    cursor.execute("SELECT id, user_id, content, tags, created_at FROM confessions WHERE status='pending' ORDER BY id ASC")
-    return cursor.fetchall()
+def get_pending_confessions_preview(limit=200):
+    # the admin listing only shows a 50-char snippet — let SQLite do the
+    # truncation so full confession bodies never leave the DB layer
+    cur = _conn().cursor()
+    cur.execute("""SELECT id, user_id, SUBSTR(content,1,50) AS snippet, tags, created_at
+                   FROM confessions WHERE status='pending' ORDER BY id ASC LIMIT ?""", (limit,))
+    return cur.fetchall()
 
 # -------------------------
 # Comments helpers (anonymous)
 # -------------------------
 def add_comment(confession_id, text):
-    cursor.execute("INSERT INTO comments (confession_id, text, created_at) VALUES (?, ?, ?)",
-                   (confession_id, text, datetime.utcnow().isoformat()))
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO comments (confession_id, text, created_at) VALUES (?, ?, strftime('%Y-%m-%dT%H:%M:%fZ','now'))",
+                (confession_id, text))
     conn.commit()
-    return cursor.lastrowid
+    return cur.lastrowid
 
-def get_comments_for_conf(confession_id, limit=50, offset=0):
-    cursor.execute("SELECT id, text, created_at FROM comments WHERE confession_id=? ORDER BY id ASC LIMIT ? OFFSET ?",
-                   (confession_id, limit, offset))
-    return cursor.fetchall()
-
-def count_comments(confession_id):
-    cursor.execute("SELECT COUNT(*) FROM comments WHERE confession_id=?", (confession_id,))
-    return cursor.fetchone()[0]
+def get_comments_for_conf(confession_id, limit=50, after_id=0):
+    # keyset pagination: resume after the last seen comment id instead of
+    # OFFSET, which would make SQLite walk and discard rows on deep pages
+    cur = _conn().cursor()
+    cur.execute("SELECT id, text, created_at FROM comments WHERE confession_id=? AND id>? ORDER BY id ASC LIMIT ?",
+                (confession_id, after_id, limit))
+    return cur.fetchall()
 
 # -------------------------
 # Channels helpers
 # -------------------------
-def add_channel(chat_id, username, added_by):
-    cursor.execute("SELECT id FROM channels WHERE id=?", (chat_id,))
-    if cursor.fetchone():
-        return False
-    cursor.execute("INSERT INTO channels (id, username, added_by, added_at) VALUES (?, ?, ?, ?)",
-                   (chat_id, username or "", added_by, datetime.utcnow().isoformat()))
+def add_channel(chat_id, username, added_by, title="", chat_type=""):
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute("""INSERT OR IGNORE INTO channels (id, username, added_by, added_at, title, type, verified_at)
+                   VALUES (?, ?, ?, strftime('%Y-%m-%dT%H:%M:%fZ','now'), ?, ?, strftime('%Y-%m-%dT%H:%M:%fZ','now'))""",
+                (chat_id, username or "", added_by, title or "", chat_type or ""))
     conn.commit()
+    if cur.rowcount == 0:
+        return False
+    _refresh_channels_cache()
     return True
 
+def get_channel(chat_id):
+    cur = _conn().cursor()
+    cur.execute("SELECT id, username, title, type, verified_at FROM channels WHERE id=?", (chat_id,))
+    return cur.fetchone()
+
+def mark_channel_verified(chat_id):
+    conn = _conn()
+    conn.execute("UPDATE channels SET verified_at=strftime('%Y-%m-%dT%H:%M:%fZ','now') WHERE id=?", (chat_id,))
+    conn.commit()
+
 def remove_channel(chat_id):
-    cursor.execute("DELETE FROM channels WHERE id=?", (chat_id,))
+    conn = _conn()
+    conn.execute("DELETE FROM channels WHERE id=?", (chat_id,))
     conn.commit()
+    _refresh_channels_cache()
+
+def _refresh_channels_cache():
+    # rebuild the snapshot eagerly on writes so fan-out paths always read
+    # an immutable tuple and never pay the reload on a hot confession
+    global _channels_cache
+    cur = _conn().cursor()
+    cur.execute("SELECT id, username, added_by, added_at FROM channels")
+    snap = tuple(cur.fetchall())  # sqlite3.Row objects are already immutable
+    with _cache_lock:
+        _channels_cache = snap
+    return snap
 
 def list_channels():
-    cursor.execute("SELECT id, username, added_by, added_at FROM channels")
-    return cursor.fetchall()
+    with _cache_lock:
+        cached = _channels_cache
+    if cached is None:
+        cached = _refresh_channels_cache()
+    return cached
 
 # -------------------------
 # Utility: format
@@ -214,15 +442,104 @@ def format_confession_text(conf):
         tags_line = "\n\n" + " ".join(f"#{t}" for t in conf["tags"])
     return f"📢 Confession #{conf['id']}\n{conf['content']}{tags_line}"
 
+# fixed template for the approval notice; only three fields vary per
+# confession, so the surrounding HTML is parsed/built exactly once
+NOTIFY_TMPL = "<b>New confession #{cid} awaiting approval</b>:\n\n{body}\n\nTags: {tags}"
+
+def notify_admins_for_approval(conf_id, content, tags):
+    # one approval notice per confession, fanned out to every admin; when a
+    # log chat is configured the body is uploaded once and copied per admin
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("✅ Approve", callback_data=f"approve|{conf_id}"),
+               types.InlineKeyboardButton("❌ Decline", callback_data=f"decline|{conf_id}"))
+    body = NOTIFY_TMPL.format(cid=conf_id, body=content, tags=" ".join(tags) if tags else "None")
+    admin_ids = [MAIN_ADMIN] + [row["id"] for row in list_secondary_admins()]
+    if LOG_CHAT_ID:
+        try:
+            sent = bot.send_message(LOG_CHAT_ID, body, reply_markup=markup)
+        except Exception:
+            sent = None
+        if sent:
+            def _copy_one(aid):
+                try:
+                    rate_limited_send(bot.copy_message, aid, LOG_CHAT_ID, sent.message_id, reply_markup=markup)
+                except Exception:
+                    pass
+            list(EXECUTOR.map(_copy_one, admin_ids))
+            return
+    def _send_one(aid):
+        try:
+            rate_limited_send(bot.send_message, aid, body, reply_markup=markup)
+        except Exception:
+            pass
+    list(EXECUTOR.map(_send_one, admin_ids))
+
+def post_confession_to_channels(conf):
+    # build the text and comment-button markup once, reuse for every channel
+    text = format_confession_text(conf)
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("💬 Comment", callback_data=f"comment|{conf['id']}"))
+    # sends run serially: this function is itself submitted to EXECUTOR
+    # (approve path), and blocking on EXECUTOR.map from inside a pool task
+    # deadlocks once every worker is waiting on tasks that can't schedule.
+    # Throughput is bounded by the rate limiter either way.
+    for ch in list_channels():
+        try:
+            rate_limited_send(bot.send_message, ch["id"], text, reply_markup=markup)
+        except Exception as e:
+            log.warning("Post error: %s", e)
+
+def finalize_confession(user_id, content, tags):
+    """Store a finished confession and either auto-post it or queue it for review."""
+    auto = is_auto_approve()
+    status = "approved" if auto else "pending"
+    conf_id = create_confession(user_id, content, tags, status=status)
+    if auto:
+        conf = get_confession_by_id(conf_id)
+        if not list_channels():
+            bot.send_message(user_id, "No channels configured. Admin will be notified.")
+        else:
+            post_confession_to_channels(conf)
+        bot.send_message(user_id, "Your confession was posted anonymously ✅")
+    else:
+        notify_admins_for_approval(conf_id, content, tags)
+        bot.send_message(user_id, "Your confession was sent for admin review ✅")
+
 # -------------------------
-# In-memory pending flows
+# Pending flows (persisted)
 # -------------------------
-# pending_confessions[user_id] = {"content": "...", "step":"awaiting_tags"}
-pending_confessions = {}
-# pending_add_comment[user_id] = confession_id they are adding a comment to
-pending_add_comment = {}
-# pagination state for viewing comments: view_comments_state[user_id] = {"confession_id": id, "page": n}
-view_comments_state = {}
+# mid-flow state (confession awaiting tags, comment awaiting text) lives
+# in the pending_state table so restarts and multi-worker webhook
+# deployments don't strand users between steps
+def set_pending(user_id, kind, payload):
+    conn = _conn()
+    conn.execute("REPLACE INTO pending_state (user_id, kind, payload) VALUES (?, ?, ?)",
+                 (user_id, kind, json.dumps(payload)))
+    conn.commit()
+
+def get_pending(user_id, kind):
+    cur = _conn().cursor()
+    cur.execute("SELECT kind, payload FROM pending_state WHERE user_id=?", (user_id,))
+    row = cur.fetchone()
+    if not row or row["kind"] != kind:
+        return None
+    return json.loads(row["payload"])
+
+def clear_pending(user_id):
+    conn = _conn()
+    conn.execute("DELETE FROM pending_state WHERE user_id=?", (user_id,))
+    conn.commit()
+
+def _expire_pending_loop():
+    # drop flows abandoned for over an hour so the table stays tiny
+    while True:
+        time.sleep(600)
+        try:
+            conn = _conn()
+            conn.execute("DELETE FROM pending_state WHERE updated_at < datetime('now','-1 hour')")
+            conn.commit()
+        except Exception:
+            pass
 
 # -------------------------
 # Handlers
@@ -237,7 +554,6 @@ def cmd_start(m):
     bot.send_message(m.chat.id, "Welcome. Tap 'Confess' to send an anonymous confession.", reply_markup=markup)
 
 # ---- CONFESSION FLOW ----
-@bot.message_handler(func=lambda msg: msg.text == "📝 Confess")
 def start_confess(msg):
     add_user_if_missing(msg.from_user.id)
     bot.send_message(msg.chat.id, "Send your confession text. After sending you'll be asked to add up to 4 tag words (or Skip).")
@@ -250,7 +566,7 @@ def receive_confession_text(msg):
         return
     # store pending
     user_id = msg.from_user.id
-    pending_confessions[user_id] = {"content": text}
+    set_pending(user_id, "confess", {"content": text})
     # ask for tags with Skip button
     markup = types.InlineKeyboardMarkup()
     markup.add(types.InlineKeyboardButton("⏭ Skip", callback_data=f"skip_tags"))
@@ -259,7 +575,8 @@ def receive_confession_text(msg):
 
 def receive_confession_tags(msg):
     user_id = msg.from_user.id
-    if user_id not in pending_confessions:
+    pending = get_pending(user_id, "confess")
+    if pending is None:
         bot.send_message(msg.chat.id, "No pending confession. Press Confess to start.")
         return
     if msg.text is None:
@@ -268,252 +585,181 @@ def receive_confession_tags(msg):
     raw = msg.text.strip()
     words = raw.split()[:4]
     tags = [w.strip().replace("#", "") for w in words if w.strip()]
-    content = pending_confessions[user_id]["content"]
     # create confession
     add_user_if_missing(user_id)
-    auto = is_auto_approve()
-    status = "approved" if auto else "pending"
-    conf_id = create_confession(user_id, content, tags, status=status)
-    conf = get_confession_by_id(conf_id)
-    # post if auto
-    if auto:
-        # post to all saved channels
-        chans = list_channels()
-        if not chans:
-            bot.send_message(user_id, "No channels configured. Admin will be notified.")
-        else:
-            for ch in chans:
-                ch_id = ch[0]
-                try:
-                    # include comment button
-                    markup = types.InlineKeyboardMarkup()
-                    markup.add(types.InlineKeyboardButton("💬 Comment", callback_data=f"comment|{conf_id}"))
-                    bot.send_message(ch_id, format_confession_text(conf), reply_markup=markup)
-                except Exception as e:
-                    print("Post error:", e)
-        bot.send_message(user_id, "Your confession was posted anonymously ✅")
-    else:
-        # send to admins for approval
-        markup = types.InlineKeyboardMarkup()
-        markup.add(types.InlineKeyboardButton("✅ Approve", callback_data=f"approve|{conf_id}"),
-                   types.InlineKeyboardButton("❌ Decline", callback_data=f"decline|{conf_id}"))
-        # notify main admin and secondary admins
-        try:
-            bot.send_message(MAIN_ADMIN, f"<b>New confession #{conf_id} awaiting approval</b>:\n\n{content}\n\nTags: {' '.join(tags) if tags else 'None'}", reply_markup=markup)
-        except Exception:
-            pass
-        for row in list_secondary_admins():
-            aid = row[0]
-            try:
-                bot.send_message(aid, f"<b>New confession #{conf_id} awaiting approval</b>:\n\n{content}\n\nTags: {' '.join(tags) if tags else 'None'}", reply_markup=markup)
-            except Exception:
-                pass
-        bot.send_message(user_id, "Your confession was sent for admin review ✅")
+    finalize_confession(user_id, pending["content"], tags)
     # cleanup
-    pending_confessions.pop(user_id, None)
+    clear_pending(user_id)
 
 # Handle Skip tags via callback
 @bot.callback_query_handler(func=lambda c: c.data == "skip_tags")
 def handle_skip_tags(call):
     user_id = call.from_user.id
-    if user_id not in pending_confessions:
+    pending = get_pending(user_id, "confess")
+    if pending is None:
         bot.answer_callback_query(call.id, "No pending confession.")
         return
-    content = pending_confessions[user_id]["content"]
     add_user_if_missing(user_id)
-    auto = is_auto_approve()
-    status = "approved" if auto else "pending"
-    conf_id = create_confession(user_id, content, [], status=status)
-    conf = get_confession_by_id(conf_id)
-    if auto:
-        chans = list_channels()
-        if not chans:
-            bot.send_message(user_id, "No channels configured. Admin will be notified.")
-        else:
-            for ch in chans:
-                ch_id = ch[0]
-                try:
-                    markup = types.InlineKeyboardMarkup()
-                    markup.add(types.InlineKeyboardButton("💬 Comment", callback_data=f"comment|{conf_id}"))
-                    bot.send_message(ch_id, format_confession_text(conf), reply_markup=markup)
-                except Exception:
-                    pass
-        bot.send_message(user_id, "Your confession was posted anonymously ✅")
-    else:
-        markup = types.InlineKeyboardMarkup()
-        markup.add(types.InlineKeyboardButton("✅ Approve", callback_data=f"approve|{conf_id}"),
-                   types.InlineKeyboardButton("❌ Decline", callback_data=f"decline|{conf_id}"))
-        try:
-            bot.send_message(MAIN_ADMIN, f"<b>New confession #{conf_id} awaiting approval</b>:\n\n{content}\n\nTags: None", reply_markup=markup)
-        except Exception:
-            pass
-        for row in list_secondary_admins():
-            aid = row[0]
-            try:
-                bot.send_message(aid, f"<b>New confession #{conf_id} awaiting approval</b>:\n\n{content}\n\nTags: None", reply_markup=markup)
-            except Exception:
-                pass
-        bot.send_message(user_id, "Your confession was sent for admin review ✅")
-    pending_confessions.pop(user_id, None)
+    finalize_confession(user_id, pending["content"], [])
+    clear_pending(user_id)
     bot.answer_callback_query(call.id, "Skipped tags — confession saved.")
 
 # ---- CALLBACKS: approve/decline/comment ----
-@bot.callback_query_handler(func=lambda call: call.data and ("|" in call.data))
-def handle_callback(call):
-    data = call.data
-    action, sid = data.split("|", 1)
-    try:
-        conf_id = int(sid)
-    except:
-        bot.answer_callback_query(call.id, "Invalid ID.")
+def cb_approve(call, rest):
+    if not is_admin(call.from_user.id):
+        bot.answer_callback_query(call.id, "Not authorized.")
         return
-
-    if action in ("approve", "decline"):
-        # Only admins
-        if not is_admin(call.from_user.id):
-            bot.answer_callback_query(call.id, "Not authorized.")
-            return
-        conf = get_confession_by_id(conf_id)
-        if not conf:
-            bot.answer_callback_query(call.id, "Confession not found.")
-            return
-        if action == "approve":
-            # mark approved and post to channels
-            set_confession_status(conf_id, "approved")
-            conf = get_confession_by_id(conf_id)
-            chans = list_channels()
-            if not chans:
-                bot.send_message(call.from_user.id, "No channels configured. Add a channel in Admin Panel.")
-            else:
-                for ch in chans:
-                    ch_id = ch[0]
-                    try:
-                        markup = types.InlineKeyboardMarkup()
-                        markup.add(types.InlineKeyboardButton("💬 Comment", callback_data=f"comment|{conf_id}"))
-                        bot.send_message(ch_id, format_confession_text(conf), reply_markup=markup)
-                    except Exception as e:
-                        print("Posting error", e)
-            bot.edit_message_text(f"Confession #{conf_id} approved & posted.", call.message.chat.id, call.message.message_id)
-            bot.answer_callback_query(call.id, "Approved.")
-        else:
-            set_confession_status(conf_id, "declined")
-            bot.edit_message_text(f"Confession #{conf_id} declined.", call.message.chat.id, call.message.message_id)
-            bot.answer_callback_query(call.id, "Declined.")
+    conf_id = int(rest)
+    conf = get_confession_by_id(conf_id)
+    if not conf:
+        bot.answer_callback_query(call.id, "Confession not found.")
         return
+    # mark approved, acknowledge the tap right away — Telegram shows a
+    # spinner until the callback is answered and the channel fan-out can
+    # take a while — then post in the background
+    set_confession_status(conf_id, "approved")
+    conf = get_confession_by_id(conf_id)
+    bot.answer_callback_query(call.id, "Approved.")
+    bot.edit_message_text(f"Confession #{conf_id} approved & posted.", call.message.chat.id, call.message.message_id)
+    if not list_channels():
+        bot.send_message(call.from_user.id, "No channels configured. Add a channel in Admin Panel.")
+    else:
+        EXECUTOR.submit(post_confession_to_channels, conf)
 
-    if action == "comment":
-        # open private chat flow: show two options View/Add
-        # send the user a private message with the options
-        conf = get_confession_by_id(conf_id)
-        if not conf:
-            bot.answer_callback_query(call.id, "Confession not found.")
-            return
-        bot.answer_callback_query(call.id, "Open your private chat with the bot to comment.")
-        user = call.from_user
-        markup = types.InlineKeyboardMarkup()
-        markup.add(types.InlineKeyboardButton("📜 View Comments", callback_data=f"viewcomments|{conf_id}"),
-                   types.InlineKeyboardButton("➕ Add Comment", callback_data=f"addcomment|{conf_id}"))
-        try:
-            bot.send_message(user.id, f"You clicked comment for Confession #{conf_id}. Choose an option:", reply_markup=markup)
-        except Exception as e:
-            # if bot cannot send private messages (user not started), instruct them
-            bot.send_message(call.message.chat.id, f"@{user.username or user.first_name}, please open the bot and press /start so you can comment privately.")
+def cb_decline(call, rest):
+    if not is_admin(call.from_user.id):
+        bot.answer_callback_query(call.id, "Not authorized.")
         return
-
-    if action == "addcomment":
-        conf = get_confession_by_id(conf_id)
-        if not conf:
-            bot.answer_callback_query(call.id, "Confession not found.")
-            return
-        # instruct user to send comment privately
+    conf_id = int(rest)
+    if not get_confession_by_id(conf_id):
+        bot.answer_callback_query(call.id, "Confession not found.")
+        return
+    set_confession_status(conf_id, "declined")
+    bot.edit_message_text(f"Confession #{conf_id} declined.", call.message.chat.id, call.message.message_id)
+    bot.answer_callback_query(call.id, "Declined.")
+
+def cb_comment(call, rest):
+    # open private chat flow: show two options View/Add
+    conf_id = int(rest)
+    if not get_confession_by_id(conf_id):
+        bot.answer_callback_query(call.id, "Confession not found.")
+        return
+    bot.answer_callback_query(call.id, "Open your private chat with the bot to comment.")
+    user = call.from_user
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("📜 View Comments", callback_data=f"viewcomments|{conf_id}"),
+               types.InlineKeyboardButton("➕ Add Comment", callback_data=f"addcomment|{conf_id}"))
+    try:
+        bot.send_message(user.id, f"You clicked comment for Confession #{conf_id}. Choose an option:", reply_markup=markup)
+    except Exception:
+        # if bot cannot send private messages (user not started), instruct them
+        bot.send_message(call.message.chat.id, f"@{user.username or user.first_name}, please open the bot and press /start so you can comment privately.")
+
+def cb_addcomment(call, rest):
+    conf_id = int(rest)
+    if not get_confession_by_id(conf_id):
+        bot.answer_callback_query(call.id, "Confession not found.")
+        return
+    # instruct user to send comment privately
+    try:
+        bot.send_message(call.from_user.id, f"Send your anonymous comment for Confession #{conf_id} or send /cancel to cancel.")
+        set_pending(call.from_user.id, "add_comment", {"confession_id": conf_id})
+        bot.answer_callback_query(call.id, "Send your comment in private chat.")
+    except Exception:
+        bot.answer_callback_query(call.id, "Open private chat with the bot first (/start).")
+
+def _send_comment_page(call, conf_id, rows, header):
+    # build the page as a list and join once; += on str is O(N^2) copies
+    parts = [header, ""]
+    parts.extend(f"- {r['text']} ({(r['created_at'] or '')[:19]})" for r in rows)
+    text = "\n".join(parts)
+    markup = types.InlineKeyboardMarkup()
+    # a full page means more comments may exist — offer Next carrying
+    # the last seen comment id, no separate COUNT(*) needed
+    if len(rows) == 10:
+        markup.add(types.InlineKeyboardButton("Next ▶", callback_data=f"viewpage|{conf_id}|{rows[-1]['id']}"))
+    try:
+        bot.send_message(call.from_user.id, text, reply_markup=markup)
+    except Exception:
+        bot.answer_callback_query(call.id, "Open private chat with the bot first (/start).")
+
+def cb_viewcomments(call, rest):
+    conf_id = int(rest)
+    if not get_confession_by_id(conf_id):
+        bot.answer_callback_query(call.id, "Confession not found.")
+        return
+    # show first page of comments (10)
+    rows = get_comments_for_conf(conf_id, limit=10)
+    if not rows:
         try:
-            bot.send_message(call.from_user.id, f"Send your anonymous comment for Confession #{conf_id} or send /cancel to cancel.")
-            pending_add_comment[call.from_user.id] = conf_id
-            bot.answer_callback_query(call.id, "Send your comment in private chat.")
+            bot.send_message(call.from_user.id, "No comments yet for this confession.")
         except Exception:
             bot.answer_callback_query(call.id, "Open private chat with the bot first (/start).")
+        return
+    _send_comment_page(call, conf_id, rows, f"Comments for Confession #{conf_id} (showing 1-{len(rows)}):")
 
-    if action == "viewcomments":
-        conf = get_confession_by_id(conf_id)
-        if not conf:
-            bot.answer_callback_query(call.id, "Confession not found.")
-            return
-        # show first page of comments (10)
-        rows = get_comments_for_conf(conf_id, limit=10, offset=0)
-        if not rows:
-            try:
-                bot.send_message(call.from_user.id, "No comments yet for this confession.")
-            except Exception:
-                bot.answer_callback_query(call.id, "Open private chat with the bot first (/start).")
-            return
-        # send formatted list with simple paging buttons
-        text = f"Comments for Confession #{conf_id} (showing 1-{len(rows)}):\n\n"
-        for r in rows:
-            text += f"- {r[1]} ({r[2][:19]})\n"
-        markup = types.InlineKeyboardMarkup()
-        # if more comments exist, add Next button
-        total = count_comments(conf_id)
-        if total > 10:
-            markup.add(types.InlineKeyboardButton("Next ▶", callback_data=f"viewpage|{conf_id}|1"))
-        try:
-            bot.send_message(call.from_user.id, text, reply_markup=markup)
-        except Exception:
-            bot.answer_callback_query(call.id, "Open private chat with the bot first (/start).")
+def cb_viewpage(call, rest):
+    # rest structure: conf_id|last_seen_comment_id
+    parts = rest.split("|")
+    if len(parts) < 2:
+        bot.answer_callback_query(call.id, "Invalid page.")
         return
+    conf_id = int(parts[0])
+    last_id = int(parts[1])
+    rows = get_comments_for_conf(conf_id, limit=10, after_id=last_id)
+    if not rows:
+        bot.answer_callback_query(call.id, "No more comments.")
+        return
+    _send_comment_page(call, conf_id, rows, f"Comments for Confession #{conf_id} (next {len(rows)}):")
+
+# O(1) action dispatch; each handler parses only the args it needs
+CALLBACK_ACTIONS = {
+    "approve": cb_approve,
+    "decline": cb_decline,
+    "comment": cb_comment,
+    "addcomment": cb_addcomment,
+    "viewcomments": cb_viewcomments,
+    "viewpage": cb_viewpage,
+}
 
-    if action == "viewpage":
-        # callback structure: viewpage|conf_id|page_index
-        parts = call.data.split("|")
-        if len(parts) < 3:
-            bot.answer_callback_query(call.id, "Invalid page.")
-            return
-        conf_id = int(parts[1])
-        page = int(parts[2])  # page 1 => offset 10
-        per = 10
-        offset = page * per
-        rows = get_comments_for_conf(conf_id, limit=per, offset=offset)
-        if not rows:
-            bot.answer_callback_query(call.id, "No more comments.")
-            return
-        text = f"Comments for Confession #{conf_id} (showing {offset+1}-{offset+len(rows)}):\n\n"
-        for r in rows:
-            text += f"- {r[1]} ({r[2][:19]})\n"
-        markup = types.InlineKeyboardMarkup()
-        total = count_comments(conf_id)
-        if offset + per < total:
-            markup.add(types.InlineKeyboardButton("Next ▶", callback_data=f"viewpage|{conf_id}|{page+1}"))
-        if page > 0:
-            prev_page = page - 1
-            markup.add(types.InlineKeyboardButton("◀ Prev", callback_data=f"viewpage|{conf_id}|{prev_page}"))
-        try:
-            bot.send_message(call.from_user.id, text, reply_markup=markup)
-        except Exception:
-            bot.answer_callback_query(call.id, "Open private chat with the bot first (/start).")
+@bot.callback_query_handler(func=lambda call: call.data and ("|" in call.data))
+def handle_callback(call):
+    action, _, rest = call.data.partition("|")
+    handler = CALLBACK_ACTIONS.get(action)
+    if handler is None:
+        bot.answer_callback_query(call.id, "Invalid ID.")
         return
+    try:
+        handler(call, rest)
+    except ValueError:
+        bot.answer_callback_query(call.id, "Invalid ID.")
 
 # ---- PRIVATE MESSAGE HANDLERS: adding comment or cancel ----
-@bot.message_handler(func=lambda m: m.chat.type == "private" and m.from_user.id in pending_add_comment.keys())
+# menu-button texts are excluded so pressing e.g. "📝 Confess" mid-comment
+# still reaches dispatch_text (this handler registers first and would
+# otherwise swallow the tap as comment text); the cheap membership test
+# also short-circuits the get_pending DB read for routed messages
+@bot.message_handler(func=lambda m: m.chat.type == "private" and m.text not in TEXT_ROUTES and get_pending(m.from_user.id, "add_comment") is not None)
 def handle_user_comment(m):
     user_id = m.from_user.id
     if m.text and m.text.strip().lower() == "/cancel":
-        pending_add_comment.pop(user_id, None)
+        clear_pending(user_id)
         bot.send_message(user_id, "Comment cancelled.")
         return
     # accept any text as comment
-    conf_id = pending_add_comment.get(user_id)
-    if not conf_id:
+    pending = get_pending(user_id, "add_comment")
+    if not pending:
         bot.send_message(user_id, "No pending comment. Use the Comment button from a post.")
         return
     text = (m.text or "").strip()
     if not text:
         bot.send_message(user_id, "Empty comment. Send text or /cancel.")
         return
-    add_comment(conf_id, text)
-    pending_add_comment.pop(user_id, None)
+    add_comment(pending["confession_id"], text)
+    clear_pending(user_id)
     bot.send_message(user_id, "Anonymous comment added ✅")
 
 # ---- ADMIN PANEL ----
-@bot.message_handler(func=lambda m: m.text == "⚙ Admin Panel" and is_admin(m.from_user.id))
 def admin_panel(m):
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add("Toggle Auto-Approve")
@@ -526,64 +772,57 @@ def admin_panel(m):
     bot.send_message(m.chat.id, "Admin Panel:", reply_markup=markup)
 
 # Toggle auto-approve
-@bot.message_handler(func=lambda m: m.text == "Toggle Auto-Approve" and is_admin(m.from_user.id))
 def toggle_auto(m):
     current = is_auto_approve()
     set_auto_approve(not current)
     bot.send_message(m.chat.id, f"Auto-approve is now {'ON' if not current else 'OFF'}.")
 
 # Broadcast to users
-@bot.message_handler(func=lambda m: m.text == "Broadcast to Users" and is_admin(m.from_user.id))
 def broadcast_to_users_prompt(m):
     bot.send_message(m.chat.id, "Send the message (text/photo/video) you want to broadcast to all users. It will be forwarded to every known user.")
     bot.register_next_step_handler(m, handle_broadcast_to_users)
 
 def handle_broadcast_to_users(m):
     users = get_all_user_ids()
-    sent = 0
-    for uid in users:
+    def _send_one(uid):
+        # broadcasts go out silent — no push-alert fan-out server-side
         try:
             if m.content_type == "text":
-                bot.send_message(uid, f"📢 Broadcast:\n\n{m.text}")
+                rate_limited_send(bot.send_message, uid, f"📢 Broadcast:\n\n{m.text}", disable_notification=True)
             elif m.content_type == "photo":
-                file_id = m.photo[-1].file_id
-                bot.send_photo(uid, file_id, caption=m.caption or "")
+                rate_limited_send(bot.send_photo, uid, m.photo[-1].file_id, caption=m.caption or "", disable_notification=True)
             elif m.content_type == "video":
-                file_id = m.video.file_id
-                bot.send_video(uid, file_id, caption=m.caption or "")
-            sent += 1
+                rate_limited_send(bot.send_video, uid, m.video.file_id, caption=m.caption or "", disable_notification=True)
+            return 1
         except Exception:
-            continue
+            return 0
+    sent = sum(EXECUTOR.map(_send_one, users))
     bot.send_message(m.chat.id, f"Broadcast attempted to {sent} users.")
 
 # Broadcast to channels
-@bot.message_handler(func=lambda m: m.text == "Broadcast to Channels" and is_admin(m.from_user.id))
 def broadcast_to_channels_prompt(m):
     bot.send_message(m.chat.id, "Send the message (text/photo/video) to broadcast to all saved channels.")
     bot.register_next_step_handler(m, handle_broadcast_to_channels)
 
 def handle_broadcast_to_channels(m):
     chans = list_channels()
-    posted = 0
-    for ch in chans:
-        ch_id = ch[0]
+    def _send_one(ch):
+        ch_id = ch["id"]
         try:
             if m.content_type == "text":
-                bot.send_message(ch_id, f"📢 Broadcast:\n\n{m.text}")
+                rate_limited_send(bot.send_message, ch_id, f"📢 Broadcast:\n\n{m.text}", disable_notification=True)
             elif m.content_type == "photo":
-                file_id = m.photo[-1].file_id
-                bot.send_photo(ch_id, file_id, caption=m.caption or "")
+                rate_limited_send(bot.send_photo, ch_id, m.photo[-1].file_id, caption=m.caption or "", disable_notification=True)
             elif m.content_type == "video":
-                file_id = m.video.file_id
-                bot.send_video(ch_id, file_id, caption=m.caption or "")
-            posted += 1
+                rate_limited_send(bot.send_video, ch_id, m.video.file_id, caption=m.caption or "", disable_notification=True)
+            return 1
         except Exception as e:
-            print("broadcast channel error", e)
-            continue
+            log.warning("broadcast channel error: %s", e)
+            return 0
+    posted = sum(EXECUTOR.map(_send_one, chans))
     bot.send_message(m.chat.id, f"Broadcast posted to {posted} channels.")
 
 # View sender by confession #
-@bot.message_handler(func=lambda m: m.text == "View Sender by Confession #" and is_admin(m.from_user.id))
 def prompt_view_sender(m):
     bot.send_message(m.chat.id, "Send the confession number to lookup the sender:")
     bot.register_next_step_handler(m, handle_view_sender)
@@ -601,7 +840,6 @@ def handle_view_sender(m):
     bot.send_message(m.chat.id, f"Confession #{num} was sent by user id: <code>{conf['user_id']}</code>")
 
 # Manage channels
-@bot.message_handler(func=lambda m: m.text == "Manage Channels" and is_admin(m.from_user.id))
 def manage_channels_menu(m):
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add("➕ Add Channel", "➖ Remove Channel")
@@ -609,7 +847,6 @@ def manage_channels_menu(m):
     markup.add("Back")
     bot.send_message(m.chat.id, "Channel Manager:", reply_markup=markup)
 
-@bot.message_handler(func=lambda m: m.text == "➕ Add Channel" and is_admin(m.from_user.id))
 def add_channel_prompt(m):
     bot.send_message(m.chat.id, "Send the channel @username (like @mychannel) or numeric chat id (-100...) to add. Make sure the bot is an admin in that channel.")
     bot.register_next_step_handler(m, handle_add_channel)
@@ -627,10 +864,8 @@ def handle_add_channel(m):
             chat = bot.get_chat(chat_id)
             username = getattr(chat, "username", "") or ""
         # check bot admin status
-        # get chat member for bot
-        me = bot.get_me()
         try:
-            member = bot.get_chat_member(chat_id, me.id)
+            member = bot.get_chat_member(chat_id, get_bot_me().id)
             # check status
             if member.status not in ("administrator", "creator"):
                 bot.send_message(m.chat.id, "Bot is not an admin in that channel. Make it admin and try again.")
@@ -638,7 +873,9 @@ def handle_add_channel(m):
         except Exception:
             bot.send_message(m.chat.id, "Unable to verify bot is admin. Ensure bot is added and has rights.")
             return
-        success = add_channel(chat_id, username, m.from_user.id)
+        success = add_channel(chat_id, username, m.from_user.id,
+                              title=getattr(chat, "title", "") or "",
+                              chat_type=getattr(chat, "type", "") or "")
         if success:
             bot.send_message(m.chat.id, f"Channel added: {chat_id} ({username})")
         else:
@@ -646,7 +883,6 @@ def handle_add_channel(m):
     except Exception as e:
         bot.send_message(m.chat.id, "Invalid channel identifier or I cannot access that channel.")
 
-@bot.message_handler(func=lambda m: m.text == "➖ Remove Channel" and is_admin(m.from_user.id))
 def remove_channel_prompt(m):
     bot.send_message(m.chat.id, "Send the numeric chat id of the channel to remove (e.g., -1001234567890).")
     bot.register_next_step_handler(m, handle_remove_channel)
@@ -659,18 +895,15 @@ def handle_remove_channel(m):
     except:
         bot.send_message(m.chat.id, "Invalid id.")
 
-@bot.message_handler(func=lambda m: m.text == "📋 List Channels" and is_admin(m.from_user.id))
 def list_channels_cmd(m):
     rows = list_channels()
     if not rows:
         bot.send_message(m.chat.id, "No channels configured.")
         return
-    text = "Configured channels:\n"
-    for r in rows:
-        text += f"- {r[0]} {('('+r[1]+')') if r[1] else ''} (added_by {r[2]})\n"
-    bot.send_message(m.chat.id, text)
+    lines = ["Configured channels:"]
+    lines.extend(f"- {r['id']} {('('+r['username']+')') if r['username'] else ''} (added_by {r['added_by']})" for r in rows)
+    bot.send_message(m.chat.id, "\n".join(lines))
 
-@bot.message_handler(func=lambda m: m.text == "Check Channel Status" and is_admin(m.from_user.id))
 def check_channel_status_prompt(m):
     bot.send_message(m.chat.id, "Send numeric channel id to check (e.g., -1001234567890):")
     bot.register_next_step_handler(m, handle_check_channel_status)
@@ -678,17 +911,27 @@ def check_channel_status_prompt(m):
 def handle_check_channel_status(m):
     try:
         cid = int(m.text.strip())
-        me = bot.get_me()
+    except:
+        bot.send_message(m.chat.id, "Invalid id.")
+        return
+    # answer immediately from the stored metadata, then verify in the
+    # background so the handler isn't blocked on a Telegram round-trip
+    row = get_channel(cid)
+    if row:
+        label = row["title"] or row["username"] or str(cid)
+        last = f", last verified {row['verified_at'][:19]}" if row["verified_at"] else ""
+        bot.send_message(m.chat.id, f"Known channel: {label} ({row['type'] or 'channel'}{last}). Verifying...")
+    def _verify():
         try:
-            member = bot.get_chat_member(cid, me.id)
+            member = bot.get_chat_member(cid, get_bot_me().id)
+            if row:
+                mark_channel_verified(cid)
             bot.send_message(m.chat.id, f"Bot's status in that channel: {member.status}")
         except Exception:
             bot.send_message(m.chat.id, "Cannot access channel or bot is not a member/admin.")
-    except:
-        bot.send_message(m.chat.id, "Invalid id.")
+    EXECUTOR.submit(_verify)
 
 # Add/Remove admin (MAIN_ADMIN ONLY)
-@bot.message_handler(func=lambda m: m.text == "Add Admin" and m.from_user.id == MAIN_ADMIN)
 def add_admin_prompt(m):
     bot.send_message(m.chat.id, "Send the Telegram ID of the user to add as secondary admin:")
     bot.register_next_step_handler(m, handle_add_admin)
@@ -707,7 +950,6 @@ def handle_add_admin(m):
     except:
         bot.send_message(m.chat.id, "Invalid id.")
 
-@bot.message_handler(func=lambda m: m.text == "Remove Admin" and m.from_user.id == MAIN_ADMIN)
 def remove_admin_prompt(m):
     bot.send_message(m.chat.id, "Send Telegram ID of the secondary admin to remove:")
     bot.register_next_step_handler(m, handle_remove_admin)
@@ -721,33 +963,102 @@ def handle_remove_admin(m):
         bot.send_message(m.chat.id, "Invalid id.")
 
 # Back button
-@bot.message_handler(func=lambda m: m.text == "Back" and is_admin(m.from_user.id))
+@admin_only
 def back_to_start(m):
     cmd_start(m)
 
+# ---- TEXT ROUTING ----
+# telebot probes every registered func= handler per incoming message; one
+# dispatcher with a dict lookup keeps that at O(1) and moves admin gating
+# behind the cheap membership test instead of into per-handler lambdas
+TEXT_ROUTES = {
+    "📝 Confess": (start_confess, None),
+    "⚙ Admin Panel": (admin_panel, "admin"),
+    "Toggle Auto-Approve": (toggle_auto, "admin"),
+    "Broadcast to Users": (broadcast_to_users_prompt, "admin"),
+    "Broadcast to Channels": (broadcast_to_channels_prompt, "admin"),
+    "View Sender by Confession #": (prompt_view_sender, "admin"),
+    "Manage Channels": (manage_channels_menu, "admin"),
+    "➕ Add Channel": (add_channel_prompt, "admin"),
+    "➖ Remove Channel": (remove_channel_prompt, "admin"),
+    "📋 List Channels": (list_channels_cmd, "admin"),
+    "Check Channel Status": (check_channel_status_prompt, "admin"),
+    "Add Admin": (add_admin_prompt, "main"),
+    "Remove Admin": (remove_admin_prompt, "main"),
+    "Back": (back_to_start, None),
+}
+
+@bot.message_handler(func=lambda m: m.text in TEXT_ROUTES)
+def dispatch_text(m):
+    handler, gate = TEXT_ROUTES[m.text]
+    if gate == "main" and m.from_user.id != MAIN_ADMIN:
+        return
+    if gate == "admin" and not is_admin(m.from_user.id):
+        return
+    handler(m)
+
 # ---- simple command to list pending confessions (admin convenience) ----
+# static %-template: cheapest row formatting CPython offers for this shape
+_PENDING_TMPL = "#%d by <code>%s</code>: %s... Tags: %s"
+
 @bot.message_handler(commands=['pending'])
+@admin_only
 def cmd_pending(m):
-    if not is_admin(m.from_user.id):
-        bot.send_message(m.chat.id, "Not authorized.")
-        return
-    rows = get_pending_confessions()
+    rows = get_pending_confessions_preview()
     if not rows:
         bot.send_message(m.chat.id, "No pending confessions.")
         return
-    text = "Pending confessions:\n"
-    for r in rows:
-        conf_id, uid, content, tags, created_at = r
-        tags_str = tags if tags else "None"
-        text += f"#{conf_id} by <code>{uid}</code>: {content[:50]}... Tags: {tags_str}\n"
-    bot.send_message(m.chat.id, text)
+    lines = ["Pending confessions:"]
+    lines.extend(_PENDING_TMPL % (conf_id, uid, snippet, tags or "None")
+                 for conf_id, uid, snippet, tags, created_at in rows)
+    # Telegram caps messages at 4096 chars — pack lines greedily into
+    # chunks in one pass instead of risking MESSAGE_TOO_LONG
+    buf, buf_len = [], 0
+    for line in lines:
+        if buf and buf_len + len(line) + 1 > 4000:
+            bot.send_message(m.chat.id, "\n".join(buf))
+            buf, buf_len = [], 0
+        buf.append(line)
+        buf_len += len(line) + 1
+    if buf:
+        bot.send_message(m.chat.id, "\n".join(buf))
 
 # -------------------------
 # START BOT
 # -------------------------
+def run_webhook():
+    """Serve updates pushed by Telegram on POST /webhook/<secret>."""
+    from flask import Flask, request, abort
+
+    app = Flask(__name__)
+
+    @app.route(f"/webhook/{WEBHOOK_SECRET}", methods=["POST"])
+    def webhook():
+        # Telegram echoes the secret_token in this header; reject anything else
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            abort(403)
+        if request.headers.get("content-type") != "application/json":
+            abort(403)
+        update = types.Update.de_json(request.get_data().decode("utf-8"))
+        bot.process_new_updates([update])
+        return ""
+
+    bot.remove_webhook()
+    time.sleep(0.1)
+    bot.set_webhook(url=f"{WEBHOOK_URL}/webhook/{WEBHOOK_SECRET}",
+                    secret_token=WEBHOOK_SECRET,
+                    drop_pending_updates=True,
+                    allowed_updates=["message", "callback_query"])
+    app.run(host="0.0.0.0", port=WEBHOOK_PORT)
+
 if __name__ == "__main__":
-    print("Bot starting...")
-    # Ensure auto_approve setting exists
-    if get_setting("auto_approve", None) is None:
-        set_auto_approve(False)
-    bot.infinity_polling(timeout=60, long_polling_timeout = 60)
+    log.info("Bot starting...")
+    threading.Thread(target=_expire_pending_loop, daemon=True).start()
+    if WEBHOOK_URL:
+        run_webhook()
+    else:
+        # skip_pending avoids replaying a backlog after restarts;
+        # allowed_updates trims each getUpdates response to what we handle
+        bot.infinity_polling(timeout=60, long_polling_timeout=60,
+                             skip_pending=True,
+                             allowed_updates=["message", "callback_query"])